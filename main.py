@@ -1,45 +1,87 @@
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, ExecutionTimeout, PyMongoError, WTimeoutError
 from bson import ObjectId
+from bson.errors import InvalidId
+from bson.regex import Regex
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 import re
-import ssl
+import hashlib
+import time
+from functools import lru_cache
+import orjson
 import certifi
+from cachetools import TTLCache
 
-app = FastAPI(title="Ecommerce Backend", description="FastAPI Ecommerce Application", version="1.0.0")
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson instead of the standard json module"""
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+app = FastAPI(
+    title="Ecommerce Backend",
+    description="FastAPI Ecommerce Application",
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
 
 # MongoDB Connection with SSL fix
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/")
 
-# Try different connection methods
-try:
-    if "mongodb+srv" in MONGO_URL:
-        # For MongoDB Atlas with SSL
-        client = MongoClient(
-            MONGO_URL,
-            ssl=True,
-            ssl_cert_reqs=ssl.CERT_NONE,
-            tlsCAFile=certifi.where(),
-            serverSelectionTimeoutMS=30000,
-            connectTimeoutMS=30000,
-            socketTimeoutMS=30000
-        )
-    else:
-        # For local MongoDB
-        client = MongoClient(MONGO_URL)
-    
-    # Test the connection
-    client.admin.command('ping')
-    print("MongoDB connection successful!")
-    
-except Exception as e:
-    print(f"MongoDB connection failed: {e}")
-    # Fallback - create client anyway, will handle errors in endpoints
-    client = MongoClient(MONGO_URL)
+# Write orders in a multi-document transaction - needs a replica set or a
+# sharded cluster (as on Atlas). Unless USE_TXN is set, this is detected
+# from the server at startup
+USE_TXN_SETTING = os.getenv("USE_TXN")
+USE_TXN = USE_TXN_SETTING is not None and USE_TXN_SETTING.lower() in ("1", "true")
+
+# Print query plans for product listings, once per filter shape (development only)
+EXPLAIN_QUERIES = os.getenv("EXPLAIN_QUERIES", "").lower() in ("1", "true")
+explained_shapes = set()
+
+# Product listing cache - pages are reused for CACHE_TTL seconds and
+# cleared whenever products or stock change
+CACHE_TTL = 30
+product_pages = TTLCache(maxsize=512, ttl=CACHE_TTL)
+# Bumped on every clear, so reads that started before it don't store stale pages
+product_pages_generation = 0
+
+# Connection pool sizing - tune per deploy with MONGO_POOL_SIZE
+MONGO_POOL_SIZE = int(os.getenv("MONGO_POOL_SIZE", "50"))
+
+# Server-side time limit for queries, so slow ones can't hold pool connections
+QUERY_TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_MS", "3000"))
+
+pool_options = {
+    "maxPoolSize": MONGO_POOL_SIZE,
+    "minPoolSize": min(10, MONGO_POOL_SIZE),
+    "maxIdleTimeMS": 30000,
+    "waitQueueTimeoutMS": 2500,
+    # Bounds waiting for write acknowledgement
+    "wTimeoutMS": QUERY_TIMEOUT_MS,
+    # Read dates back as UTC-aware datetimes so responses carry the offset
+    "tz_aware": True
+}
+
+# Single shared client - Motor connects lazily, so the connection is verified on startup
+if "mongodb+srv" in MONGO_URL:
+    # For MongoDB Atlas with SSL
+    client = AsyncIOMotorClient(
+        MONGO_URL,
+        tls=True,
+        tlsCAFile=certifi.where(),
+        serverSelectionTimeoutMS=30000,
+        connectTimeoutMS=30000,
+        socketTimeoutMS=30000,
+        **pool_options
+    )
+else:
+    # For local MongoDB
+    client = AsyncIOMotorClient(MONGO_URL, **pool_options)
 
 db = client.ecommerce
 
@@ -53,118 +95,240 @@ class ProductCreate(BaseModel):
     price: float
     quantity: int
 
-class Product(BaseModel):
-    id: str = Field(alias="_id")
-    name: str
-    price: float
-    quantity: int
-
 class OrderItem(BaseModel):
     product_id: str
     bought_quantity: int
 
 class OrderCreate(BaseModel):
-    items: List[OrderItem]
-    user_address: Dict[str, Any]
-
-class Order(BaseModel):
-    id: str = Field(alias="_id")
-    items: List[Dict[str, Any]]
-    total_amount: float
+    user_id: str
+    items: List[OrderItem] = Field(min_length=1)
     user_address: Dict[str, Any]
-    timestamp: str
 
 class ApiResponse(BaseModel):
     message: str
 
 # Helper Functions
-def serialize_doc(doc):
-    """Convert MongoDB document to JSON serializable format"""
-    if doc is None:
+def parse_cursor(after):
+    """Convert an `after` pagination cursor to an ObjectId"""
+    if after is None:
         return None
-    doc['_id'] = str(doc['_id'])
-    return doc
+    try:
+        return ObjectId(after)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+def next_cursor(docs, limit):
+    """Cursor for the page after `docs`, or None on the last page"""
+    if len(docs) < limit:
+        return None
+    return str(docs[-1]["_id"])
+
+@lru_cache(maxsize=256)
+def prefix_pattern(name):
+    """Anchored BSON regex matching names that start with `name` literally"""
+    # bson Regex rather than re.compile - a compiled str pattern carries the
+    # unicode flag, which stops the server from using tight index bounds
+    return Regex(f"^{re.escape(name)}")
+
+def has_error_label(e, label):
+    """Whether a database exception carries the given transaction error label"""
+    return isinstance(e, PyMongoError) and e.has_error_label(label)
 
-def serialize_docs(docs):
-    """Convert list of MongoDB documents to JSON serializable format"""
-    return [serialize_doc(doc) for doc in docs]
+def is_bulk_wtimeout(e):
+    """Whether a bulk write failed waiting for write acknowledgement"""
+    # bulk_write reports write concern timeouts as BulkWriteError, not WTimeoutError
+    if not isinstance(e, BulkWriteError):
+        return False
+    return any(
+        error.get("code") == 64 or error.get("errInfo", {}).get("wtimeout")
+        for error in e.details.get("writeConcernErrors", [])
+    )
 
-def handle_db_operation(operation):
-    """Handle database operations with proper error handling"""
+def db_error(e):
+    """Map a database exception to an HTTPException"""
+    if isinstance(e, (ExecutionTimeout, WTimeoutError)) or is_bulk_wtimeout(e):
+        return HTTPException(status_code=504, detail="Database operation timed out")
+    if has_error_label(e, "TransientTransactionError"):
+        # Still conflicting with concurrent orders after retrying
+        return HTTPException(status_code=409, detail="Order conflicted with concurrent orders. Please retry.")
+    error_msg = str(e)
+    if "SSL" in error_msg or "handshake" in error_msg:
+        return HTTPException(
+            status_code=503, 
+            detail="Database connection issue. Please check MongoDB Atlas configuration."
+        )
+    return HTTPException(status_code=500, detail=f"Database error: {error_msg}")
+
+@app.on_event("startup")
+async def check_connection():
+    """Test the connection and detect whether transactions are available"""
+    global USE_TXN
     try:
-        return operation()
+        hello = await client.admin.command('hello')
+        print("MongoDB connection successful!")
+        if USE_TXN_SETTING is None:
+            # Replica set members report setName, mongos reports isdbgrid
+            USE_TXN = "setName" in hello or hello.get("msg") == "isdbgrid"
+            print(f"MongoDB transactions {'enabled' if USE_TXN else 'disabled'} for orders")
     except Exception as e:
-        error_msg = str(e)
-        if "SSL" in error_msg or "handshake" in error_msg:
-            raise HTTPException(
-                status_code=503, 
-                detail="Database connection issue. Please check MongoDB Atlas configuration."
-            )
-        else:
-            raise HTTPException(status_code=500, detail=f"Database error: {error_msg}")
+        # Keep serving - the pool reconnects on the next request
+        print(f"MongoDB connection failed: {e}")
 
-# Root endpoint now shows products (what they want to test)
-@app.get("/")
-async def root(
-    name: Optional[str] = Query(None, description="Filter by product name (supports regex)"),
-    size: Optional[str] = Query(None, description="Filter by size"),
-    limit: Optional[int] = Query(10, description="Number of products to return"),
-    offset: Optional[int] = Query(0, description="Number of products to skip")
-):
-    """List all products - this is now the root endpoint for testing"""
+@app.on_event("startup")
+async def create_indexes():
+    """Create the indexes used by the list endpoints"""
     try:
-        def get_products():
-            # Build query filter
-            query_filter = {}
-            
-            if name:
-                # Support partial search with regex
-                query_filter["name"] = {"$regex": name, "$options": "i"}
-            
-            if size:
-                query_filter["size"] = size
-            
-            # Get products with pagination
-            cursor = products_collection.find(query_filter).skip(offset).limit(limit)
-            products = list(cursor)
-            return products
-        
-        products = handle_db_operation(get_products)
-        
-        # Serialize products
-        serialized_products = serialize_docs(products)
-        
-        # If no products exist, return a helpful message
-        if not serialized_products:
-            return {
-                "message": "Ecommerce Backend API is running!",
-                "products": [],
-                "note": "No products found. Use POST /products to add products.",
-                "status": "Database connected successfully"
-            }
-        
-        return {"products": serialized_products}
+        # Text index backs the default name search
+        await products_collection.create_index([("name", "text")])
+        # Listings sort on _id, so indexes follow equality-sort-range order.
+        # Size equality, then the _id sort, then the name prefix range - its
+        # (size, _id) prefix also serves size-only listings
+        await products_collection.create_index([("size", 1), ("_id", 1), ("name", 1)])
+        # Prefix-only search scans the matching name range and sorts those
+        # matches, which beats walking the whole _id index for a selective prefix
+        await products_collection.create_index([("name", 1)])
+        # Per-user order history, newest first
+        await orders_collection.create_index([("user_id", 1), ("_id", -1)])
+    except Exception as e:
+        print(f"Index creation failed: {e}")
+
+# Fields returned by product listings - _id is stringified inside MongoDB
+# instead of per document in Python
+PRODUCT_FIELDS = {"name": 1, "price": 1, "quantity": 1, "size": 1}
+PRODUCT_PROJECTION = {**PRODUCT_FIELDS, "_id": {"$toString": "$_id"}}
+TEXT_PROJECTION = {**PRODUCT_PROJECTION, "score": {"$meta": "textScore"}}
+
+# Stable _id order so next_cursor lines up with the following page; text
+# search ranks best matches first instead
+SORT_BY_ID = {"_id": 1}
+SORT_BY_SCORE = {"score": {"$meta": "textScore"}}
+
+# Product filter builders keyed by (name match, size given), where name match
+# is None, "prefix" (anchored, case-sensitive regex so the name index can be
+# used) or "text" (word search on the text index)
+PRODUCT_FILTERS = {
+    (None, False): lambda name, size: {},
+    (None, True): lambda name, size: {"size": size},
+    ("prefix", False): lambda name, size: {"name": prefix_pattern(name)},
+    ("prefix", True): lambda name, size: {"name": prefix_pattern(name), "size": size},
+    ("text", False): lambda name, size: {"$text": {"$search": name}},
+    ("text", True): lambda name, size: {"$text": {"$search": name}, "size": size}
+}
+
+def product_pipeline(name, size, limit, offset, mode, after=None):
+    """Aggregation pipeline for a page of products matching the name/size filters.
     
-    except HTTPException:
-        raise
+    Returns the pipeline and whether it is a relevance-ranked text search.
+    """
+    name_match = mode if name else None
+    query_filter = PRODUCT_FILTERS[(name_match, bool(size))](name, size)
+    text_search = name_match == "text"
+    
+    # Keyset pagination - seek past the cursor on the _id index instead of skipping
+    after_id = parse_cursor(after)
+    if after_id is not None:
+        if text_search:
+            raise HTTPException(status_code=400, detail="Text search results are ranked by relevance, use offset to page them")
+        query_filter["_id"] = {"$gt": after_id}
+    
+    pipeline = [
+        {"$match": query_filter},
+        {"$sort": SORT_BY_SCORE if text_search else SORT_BY_ID},
+        {"$skip": offset},
+        {"$limit": limit},
+        {"$project": TEXT_PROJECTION if text_search else PRODUCT_PROJECTION}
+    ]
+    return pipeline, text_search
+
+async def find_products(name, size, limit, offset, mode, after=None):
+    """Fetch a page of products matching the name/size filters.
+    
+    Returns the products and the cursor of the next page (None for the
+    last page, and for relevance-ranked text search, which pages by offset).
+    """
+    pipeline, text_search = product_pipeline(name, size, limit, offset, mode, after)
+    
+    # Get products with pagination
+    try:
+        shape = (mode if name else None, bool(size), after is not None)
+        if EXPLAIN_QUERIES and shape not in explained_shapes:
+            # Dev aid - check the winning plan is an IXSCAN, not a COLLSCAN
+            explained_shapes.add(shape)
+            plan = await db.command(
+                "explain",
+                {"aggregate": products_collection.name, "pipeline": pipeline, "cursor": {}},
+                verbosity="queryPlanner"
+            )
+            print(f"Query plan for {pipeline[0]['$match']}: {plan.get('queryPlanner', plan.get('stages'))}")
+        products = await products_collection.aggregate(pipeline, maxTimeMS=QUERY_TIMEOUT_MS).to_list(length=limit)
     except Exception as e:
-        return {
-            "message": "Ecommerce Backend API is running!",
-            "error": f"Database connection issue: {str(e)}",
-            "products": [],
-            "note": "Please check MongoDB Atlas configuration"
-        }
+        raise db_error(e)
+    
+    return products, None if text_search else next_cursor(products, limit)
+
+async def get_product_page(name, size, limit, offset, mode, after):
+    """Cached find_products - returns serialized products, next cursor and ETag"""
+    key = (name, size, limit, offset, mode, after)
+    page = product_pages.get(key)
+    if page is None:
+        generation = product_pages_generation
+        products, cursor = await find_products(name, size, limit, offset, mode, after)
+        etag = hashlib.md5(orjson.dumps([products, cursor], default=str, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        page = (products, cursor, f'"{etag}"')
+        # Only cache if no write cleared the cache while this page was read
+        if generation == product_pages_generation:
+            product_pages[key] = page
+    return page
+
+def clear_product_pages():
+    """Drop cached listings after products or stock change"""
+    global product_pages_generation
+    product_pages_generation += 1
+    product_pages.clear()
+
+def wants_ndjson(request):
+    """Whether the client asked for a streamed NDJSON response"""
+    return "application/x-ndjson" in request.headers.get("accept", "")
+
+async def ndjson_response(cursor):
+    """Stream documents from a cursor as they arrive, one JSON document per line"""
+    # Run the query before the 200 is sent, so query errors still map to
+    # proper status codes instead of a truncated stream
+    try:
+        first = await cursor.next()
+    except StopAsyncIteration:
+        first = None
+    except Exception as e:
+        raise db_error(e)
+    
+    async def stream():
+        if first is None:
+            return
+        yield orjson.dumps(first, default=str) + b"\n"
+        async for doc in cursor:
+            yield orjson.dumps(doc, default=str) + b"\n"
+    
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+def cache_headers(etag):
+    """HTTP caching headers for a product listing"""
+    return {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={CACHE_TTL}, stale-while-revalidate={CACHE_TTL}"
+    }
 
 # Create Products API
 @app.post("/products", status_code=201)
 async def create_product(product: ProductCreate):
     try:
-        product_dict = product.dict()
-        
-        def insert_product():
-            return products_collection.insert_one(product_dict)
+        product_dict = product.model_dump()
         
-        result = handle_db_operation(insert_product)
+        try:
+            await products_collection.insert_one(product_dict)
+            # New product - cached listings are stale
+            clear_product_pages()
+        except Exception as e:
+            raise db_error(e)
         
         return ApiResponse(message="Product created successfully")
     
@@ -173,43 +337,135 @@ async def create_product(product: ProductCreate):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-# List Products API (keeping this for API consistency)
+# List Products API - also served at the root for quick testing
+@app.get("/", status_code=200, include_in_schema=False)
 @app.get("/products", status_code=200)
 async def list_products(
-    name: Optional[str] = Query(None, description="Filter by product name (supports regex)"),
+    request: Request,
+    name: Optional[str] = Query(None, description="Filter by product name (text search, or prefix with mode=prefix)"),
     size: Optional[str] = Query(None, description="Filter by size"),
-    limit: Optional[int] = Query(10, description="Number of products to return"),
-    offset: Optional[int] = Query(0, description="Number of products to skip")
+    limit: int = Query(10, ge=1, description="Number of products to return"),
+    offset: int = Query(0, ge=0, description="Number of products to skip (deprecated, use after)"),
+    after: Optional[str] = Query(None, description="Return products after this cursor (next_cursor of the previous page)"),
+    mode: str = Query("text", pattern="^(text|prefix)$", description="Name matching: text (indexed word search) or prefix (case-sensitive starts-with)")
 ):
     try:
-        def get_products():
-            # Build query filter
-            query_filter = {}
-            
-            if name:
-                # Support partial search with regex
-                query_filter["name"] = {"$regex": name, "$options": "i"}
-            
-            if size:
-                query_filter["size"] = size
-            
-            # Get products with pagination
-            cursor = products_collection.find(query_filter).skip(offset).limit(limit)
-            products = list(cursor)
-            return products
+        if wants_ndjson(request):
+            # Stream straight from MongoDB instead of building the page in memory
+            pipeline, _ = product_pipeline(name, size, limit, offset, mode, after)
+            cursor = products_collection.aggregate(pipeline, maxTimeMS=QUERY_TIMEOUT_MS)
+            return await ndjson_response(cursor)
         
-        products = handle_db_operation(get_products)
+        serialized_products, cursor, etag = await get_product_page(name, size, limit, offset, mode, after)
         
-        # Serialize products
-        serialized_products = serialize_docs(products)
+        # Client already has this page
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=cache_headers(etag))
         
-        return {"products": serialized_products}
+        # Returned directly so FastAPI skips jsonable_encoder
+        return ORJSONResponse(
+            {"products": serialized_products, "next_cursor": cursor},
+            headers=cache_headers(etag)
+        )
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def stock_conflict():
+    """409 for a product that sold out between the read and the update"""
+    return HTTPException(
+        status_code=409,
+        detail="Stock changed while placing the order. Please retry."
+    )
+
+async def reserve_stock(requested, session=None):
+    """Decrement stock for each requested product, or raise 409 if one sold out"""
+    # The $gte guard stops a concurrent order from overselling
+    if session is not None:
+        # Inside a transaction one bulk write is enough - a 409 aborts it
+        result = await products_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": oid, "quantity": {"$gte": quantity}},
+                    {"$inc": {"quantity": -quantity}}
+                )
+                for oid, quantity in requested.items()
+            ],
+            ordered=False,
+            session=session
+        )
+        if result.matched_count != len(requested):
+            raise stock_conflict()
+        return
+    
+    # Without a transaction, decrement one product at a time so the ones
+    # already applied can be given back when a later product has sold out
+    reserved = {}
+    for oid, quantity in requested.items():
+        result = await products_collection.update_one(
+            {"_id": oid, "quantity": {"$gte": quantity}},
+            {"$inc": {"quantity": -quantity}}
+        )
+        if result.matched_count == 0:
+            await release_stock(reserved)
+            raise stock_conflict()
+        reserved[oid] = quantity
+
+async def release_stock(reserved):
+    """Give back stock taken by reserve_stock outside a transaction"""
+    for oid, quantity in reserved.items():
+        try:
+            await products_collection.update_one({"_id": oid}, {"$inc": {"quantity": quantity}})
+        except Exception as e:
+            print(f"Could not give back {quantity} of product {oid}, fix its stock by hand: {e}")
+
+async def write_order(requested, order_doc, session=None):
+    """Decrement stock for each requested product and insert the order"""
+    await reserve_stock(requested, session)
+    
+    # Insert order into MongoDB
+    try:
+        await orders_collection.insert_one(order_doc, session=session)
+    except Exception:
+        if session is None:
+            # No transaction to roll back - give the stock back by hand
+            await release_stock(requested)
+        raise
+
+async def write_order_transaction(requested, order_doc):
+    """Run write_order in a transaction, retrying transient errors within QUERY_TIMEOUT_MS"""
+    # Hand-rolled session.with_transaction: its 120s retry budget would let write
+    # conflicts on a hot product hold the request far past the query timeout
+    deadline = time.monotonic() + QUERY_TIMEOUT_MS / 1000
+    async with await client.start_session() as session:
+        while True:
+            session.start_transaction(max_commit_time_ms=QUERY_TIMEOUT_MS)
+            try:
+                await write_order(requested, order_doc, session)
+            except Exception as e:
+                if session.in_transaction:
+                    await session.abort_transaction()
+                # Write conflict with a concurrent order - run the transaction again
+                if has_error_label(e, "TransientTransactionError") and time.monotonic() < deadline:
+                    continue
+                raise
+            
+            while True:
+                try:
+                    await session.commit_transaction()
+                    return
+                except PyMongoError as e:
+                    if time.monotonic() >= deadline:
+                        raise
+                    # Commit outcome unknown - committing again is safe
+                    if has_error_label(e, "UnknownTransactionCommitResult"):
+                        continue
+                    if has_error_label(e, "TransientTransactionError"):
+                        break
+                    raise
+
 # Create Order API
 @app.post("/orders", status_code=201)
 async def create_order(order: OrderCreate):
@@ -217,19 +473,34 @@ async def create_order(order: OrderCreate):
         total_amount = 0.0
         order_items = []
         
-        def process_order():
-            nonlocal total_amount, order_items
+        # Parse every product id up front so bad input is rejected before any write
+        try:
+            ids = [ObjectId(item.product_id) for item in order.items]
+        except InvalidId:
+            raise HTTPException(status_code=400, detail="Invalid product id")
+        
+        try:
+            # Fetch every product in the order with a single query
+            cursor = products_collection.find(
+                {"_id": {"$in": ids}},
+                {"price": 1, "quantity": 1, "name": 1}
+            ).max_time_ms(QUERY_TIMEOUT_MS)
+            products = {product["_id"]: product for product in await cursor.to_list(length=None)}
+            
+            # Total quantity requested per product
+            requested = {}
+            for oid, item in zip(ids, order.items):
+                requested[oid] = requested.get(oid, 0) + item.bought_quantity
             
             # Process each item in the order
-            for item in order.items:
-                # Find the product
-                product = products_collection.find_one({"_id": ObjectId(item.product_id)})
+            for oid, item in zip(ids, order.items):
+                product = products.get(oid)
                 
                 if not product:
                     raise HTTPException(status_code=404, detail=f"Product with id {item.product_id} not found")
                 
                 # Check if enough quantity is available
-                if product["quantity"] < item.bought_quantity:
+                if product["quantity"] < requested[oid]:
                     raise HTTPException(
                         status_code=400, 
                         detail=f"Not enough quantity available for product {product['name']}"
@@ -239,13 +510,6 @@ async def create_order(order: OrderCreate):
                 item_total = product["price"] * item.bought_quantity
                 total_amount += item_total
                 
-                # Update product quantity
-                new_quantity = product["quantity"] - item.bought_quantity
-                products_collection.update_one(
-                    {"_id": ObjectId(item.product_id)},
-                    {"$set": {"quantity": new_quantity}}
-                )
-                
                 # Add item to order
                 order_items.append({
                     "product_id": item.product_id,
@@ -256,16 +520,27 @@ async def create_order(order: OrderCreate):
             
             # Create order document
             order_doc = {
+                "user_id": order.user_id,
                 "items": order_items,
                 "total_amount": total_amount,
                 "user_address": order.user_address,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.now(timezone.utc)
             }
             
-            # Insert order into MongoDB
-            return orders_collection.insert_one(order_doc)
-        
-        result = handle_db_operation(process_order)
+            try:
+                if USE_TXN:
+                    # All-or-nothing: a failed write rolls back the other stock updates
+                    await write_order_transaction(requested, order_doc)
+                else:
+                    await write_order(requested, order_doc)
+            finally:
+                # Stock changed, even if only until a rejected order gave it
+                # back - cached listings are stale
+                clear_product_pages()
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise db_error(e)
         
         return ApiResponse(message="Order created successfully")
     
@@ -277,21 +552,39 @@ async def create_order(order: OrderCreate):
 # Get List of Orders
 @app.get("/orders/{user_id}", status_code=200)
 async def get_user_orders(
+    request: Request,
     user_id: str,
-    limit: Optional[int] = Query(10, description="Number of orders to return"),
-    offset: Optional[int] = Query(0, description="Number of orders to skip")
+    limit: int = Query(10, ge=1, description="Number of orders to return"),
+    offset: int = Query(0, ge=0, description="Number of orders to skip (deprecated, use after)"),
+    after: Optional[str] = Query(None, description="Return orders after this cursor (next_cursor of the previous page)")
 ):
     try:
-        def get_orders():
-            cursor = orders_collection.find().skip(offset).limit(limit)
-            return list(cursor)
+        # Newest first, served by the (user_id, _id) index
+        query_filter = {"user_id": user_id}
+        after_id = parse_cursor(after)
+        if after_id is not None:
+            query_filter["_id"] = {"$lt": after_id}
+        
+        pipeline = [
+            {"$match": query_filter},
+            {"$sort": {"_id": -1}},
+            {"$skip": offset},
+            {"$limit": limit},
+            {"$addFields": {"_id": {"$toString": "$_id"}}}
+        ]
         
-        orders = handle_db_operation(get_orders)
+        if wants_ndjson(request):
+            # Stream straight from MongoDB instead of building the page in memory
+            cursor = orders_collection.aggregate(pipeline, maxTimeMS=QUERY_TIMEOUT_MS)
+            return await ndjson_response(cursor)
         
-        # Serialize orders
-        serialized_orders = serialize_docs(orders)
+        try:
+            orders = await orders_collection.aggregate(pipeline, maxTimeMS=QUERY_TIMEOUT_MS).to_list(length=limit)
+        except Exception as e:
+            raise db_error(e)
         
-        return {"orders": serialized_orders}
+        # Returned directly so FastAPI skips jsonable_encoder
+        return ORJSONResponse({"orders": orders, "next_cursor": next_cursor(orders, limit)})
     
     except HTTPException:
         raise
@@ -300,4 +593,11 @@ async def get_user_orders(
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # One event loop per worker process; uvloop is used when installed
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        loop="auto"
+    )
@@ -41,6 +41,7 @@ def test_create_order(product_id):
     url = f"{BASE_URL}/orders"
     
     order_data = {
+        "user_id": "test_user_123",
         "items": [
             {
                 "product_id": product_id,
@@ -64,7 +65,7 @@ def test_create_order(product_id):
 def test_list_orders():
     """Test listing orders"""
     print("Testing List Orders API...")
-    user_id = "test_user_123"  # This is just a placeholder for the URL
+    user_id = "test_user_123"  # Same user as in test_create_order
     url = f"{BASE_URL}/orders/{user_id}"
     
     response = requests.get(url)